@@ -1,31 +1,40 @@
+import functools
+import gzip
+import io
 import json
 import os
-from datetime import date, datetime, timedelta
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 import re
-from typing import List, Dict, Any, Optional, TypedDict, cast
-from notion_client import Client
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    TypedDict,
+    cast,
+)
+from notion_client import APIErrorCode, APIResponseError, Client
 from dotenv import load_dotenv
 from icalendar import Calendar
 
-from dateutil import tz
+import urllib.error
 import urllib.request  # Import the built-in http request module
-from dateutil import parser
 import logging  # Add this import at the top of the file
 
-# Set up logging configuration
-logging.basicConfig(level=logging.INFO)  # You can adjust the level as needed
+import httpx
 
-# Load environment variables from .env file
-load_dotenv()
-
-
-# Define a TypedDict for the event structure
-class GCalEvent(TypedDict):
-    summary: str
-    start: date
-    end: date
-    description: str
-    id: str
+try:
+    import orjson
+except ImportError:  # orjson is optional, responses are then parsed with json
+    orjson = None  # type: ignore[assignment]
 
 
 # Event which is specifically a guest stay
@@ -54,7 +63,341 @@ class NotionGuest(TypedDict):
     name: str
 
 
-def get_calendar_events(days_ago: int | None = None) -> List[GCalEvent]:
+# Notion client which parses successful responses with orjson, which is much faster
+# than the stdlib json parser on large database queries
+class OrjsonNotionClient(Client):
+    def _parse_response(self, response: httpx.Response) -> Any:
+        if not response.is_success:
+            return super()._parse_response(response)
+        body = orjson.loads(response.content)
+        self.logger.debug("=> %s", body)
+
+        return body
+
+
+@functools.lru_cache(maxsize=None)
+def create_notion_client() -> Client:
+    client_class = OrjsonNotionClient if orjson else Client
+    return client_class(auth=os.environ["NOTION_TOKEN"])
+
+
+# lru_cache doesn't stop two threads from building the client at the same time
+notion_client_lock = threading.Lock()
+
+
+# Shared Notion client, so every API call reuses the same keep-alive connection
+def get_notion_client() -> Client:
+    with notion_client_lock:
+        return create_notion_client()
+
+
+# Notion allows ~3 requests/s on average, so keep the number of inflight requests low
+NOTION_MAX_WORKERS = 4
+NOTION_MAX_RETRIES = 5
+
+T = TypeVar("T")
+
+
+# Call the Notion API, backing off and retrying when we get rate limited (HTTP 429)
+def with_notion_retry(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    for attempt in range(NOTION_MAX_RETRIES):
+        try:
+            return func(*args, **kwargs)
+        except APIResponseError as error:
+            if (
+                error.code != APIErrorCode.RateLimited
+                or attempt == NOTION_MAX_RETRIES - 1
+            ):
+                raise
+            delay = float(error.headers.get("Retry-After", 2**attempt))
+            logging.warning("Notion: Rate limited, retrying in %ss", delay)
+            time.sleep(delay)
+    raise RuntimeError("unreachable")
+
+
+# Iterate over every row of a Notion database, following the pagination cursor
+def query_notion_database(database_id: str) -> Iterator[Dict[str, Any]]:
+    notion = get_notion_client()
+    cursor: Optional[str] = None
+    while True:
+        kwargs: Dict[str, Any] = {"database_id": database_id, "page_size": 100}
+        if cursor:
+            kwargs["start_cursor"] = cursor
+        results = cast(
+            Dict[str, Any], with_notion_retry(notion.databases.query, **kwargs)
+        )
+        yield from results["results"]
+        if not results["has_more"]:
+            break
+        cursor = results["next_cursor"]
+
+
+# Guests are matched on their first name, case-insensitively
+def guest_key(name: str) -> str:
+    parts = name.casefold().split()
+    return parts[0] if parts else ""
+
+
+# Local copy of the last downloaded calendar, revalidated with a conditional GET
+ICAL_CACHE_PATH = ".ics.cache"
+ICAL_CACHE_META_PATH = ".ics.cache.json"
+# Events extracted from the cached calendar, so an unchanged calendar isn't parsed again
+ICAL_PARSED_CACHE_PATH = ".ics.parsed.pkl"
+
+# (uid, summary, dtstart, dtend, description) of a VEVENT
+ICalEvent = Tuple[str, str, date, Optional[date], str]
+
+
+# Write a file atomically, so an interrupted run never leaves a half-written cache
+def write_file_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# Validators of the cached calendar, or an empty dict if there is no usable cache
+def read_ical_cache_meta(ical_url: str) -> Dict[str, str]:
+    if not (os.path.exists(ICAL_CACHE_PATH) and os.path.exists(ICAL_CACHE_META_PATH)):
+        return {}
+    with open(ICAL_CACHE_META_PATH) as f:
+        cache_meta = cast(Dict[str, str], json.load(f))
+    # The cache is only valid for the URL it was downloaded from
+    if cache_meta.get("url") != ical_url:
+        return {}
+    return cache_meta
+
+
+# Download the calendar, or return None if the cached copy is still up to date.
+# Also return the validators (ETag/Last-Modified) of the calendar version in use.
+def fetch_ical_data(ical_url: str) -> Tuple[Optional[str], Dict[str, str]]:
+    cache_meta = read_ical_cache_meta(ical_url)
+
+    headers = {"Accept-Encoding": "gzip"}
+    if "etag" in cache_meta:
+        headers["If-None-Match"] = cache_meta["etag"]
+    if "last_modified" in cache_meta:
+        headers["If-Modified-Since"] = cache_meta["last_modified"]
+
+    request = urllib.request.Request(ical_url, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            if response.status != 200:
+                raise ValueError(f"HTTP error: {response.status}")
+            body = response.read()
+            if response.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as error:
+        if error.code != 304 or not cache_meta:
+            raise
+        logging.info("GCal: Calendar not modified, using cached copy")
+        return None, cache_meta
+
+    new_cache_meta = {"url": ical_url}
+    if etag:
+        new_cache_meta["etag"] = etag
+    if last_modified:
+        new_cache_meta["last_modified"] = last_modified
+    # The parsed events belong to the previous calendar body
+    if os.path.exists(ICAL_PARSED_CACHE_PATH):
+        os.remove(ICAL_PARSED_CACHE_PATH)
+    write_file_atomic(ICAL_CACHE_PATH, body)
+    write_file_atomic(ICAL_CACHE_META_PATH, json.dumps(new_cache_meta).encode())
+
+    return body.decode("utf-8"), new_cache_meta
+
+
+# Escaped characters in iCal TEXT values (RFC 5545, section 3.3.11)
+ICAL_TEXT_ESCAPES = {"\\": "\\", ";": ";", ",": ",", "n": "\n", "N": "\n"}
+ICAL_TEXT_ESCAPE_RE = re.compile(r"\\(.)")
+
+
+def unescape_ical_text(value: str) -> str:
+    return ICAL_TEXT_ESCAPE_RE.sub(
+        lambda match: ICAL_TEXT_ESCAPES.get(match[1], match[0]), value
+    )
+
+
+# Parse a DATE or DATE-TIME value. Date-times are only used to tell timed events
+# apart from all-day ones, so a TZID parameter is not resolved.
+def parse_ical_date(value: str) -> date:
+    if "T" not in value:
+        return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    parsed = datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+# Properties of a VEVENT which we extract
+ICAL_EVENT_PROPERTIES = {"UID", "SUMMARY", "DTSTART", "DTEND", "DESCRIPTION"}
+
+
+def event_from_ical_properties(properties: Dict[str, str]) -> Optional[ICalEvent]:
+    if "DTSTART" not in properties:
+        logging.warning("GCal: No start date for event %s", properties.get("UID"))
+        return None
+    try:
+        start = parse_ical_date(properties["DTSTART"])
+        end = parse_ical_date(properties["DTEND"]) if "DTEND" in properties else None
+    except ValueError:
+        logging.warning("GCal: Invalid date for event %s", properties.get("UID"))
+        return None
+    return (
+        properties.get("UID", ""),
+        unescape_ical_text(properties.get("SUMMARY", "")),
+        start,
+        end,
+        unescape_ical_text(properties.get("DESCRIPTION", "")),
+    )
+
+
+# Yield the content lines of a calendar, joining folded lines back together
+def unfold_ical_lines(ical_data: str) -> Iterator[str]:
+    content_line: Optional[str] = None
+    for raw_line in io.StringIO(ical_data):
+        line = raw_line.rstrip("\r\n")
+        if line.startswith((" ", "\t")):
+            if content_line is not None:
+                content_line += line[1:]
+            continue
+        if content_line is not None:
+            yield content_line
+        content_line = line
+    if content_line is not None:
+        yield content_line
+
+
+# Split a content line into its name with parameters, and its value. Parameter
+# values may be quoted and contain colons, e.g. TZID="(UTC+01:00) Amsterdam".
+def split_ical_content_line(line: str) -> Tuple[str, str]:
+    if '"' not in line:
+        head, _, value = line.partition(":")
+        return head, value
+    in_quotes = False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ":" and not in_quotes:
+            return line[:index], line[index + 1 :]
+    return line, ""
+
+
+# Extract the events by scanning the content lines directly, which is much faster
+# than building the full icalendar object tree
+def scan_ical_events(ical_data: str) -> List[ICalEvent]:
+    events: List[ICalEvent] = []
+    # Properties of the current VEVENT, or None outside of one
+    properties: Optional[Dict[str, str]] = None
+    # Depth of components nested in the current VEVENT (e.g. VALARM)
+    nested_depth = 0
+
+    for line in unfold_ical_lines(ical_data):
+        head, value = split_ical_content_line(line)
+        name = head.split(";", 1)[0].upper()
+
+        if name == "BEGIN":
+            if value == "VEVENT" and properties is None:
+                properties = {}
+            elif properties is not None:
+                nested_depth += 1
+        elif name == "END" and properties is not None:
+            if nested_depth:
+                nested_depth -= 1
+            elif value == "VEVENT":
+                event = event_from_ical_properties(properties)
+                if event:
+                    events.append(event)
+                properties = None
+        elif properties is not None and nested_depth == 0:
+            if name in ICAL_EVENT_PROPERTIES:
+                properties[name] = value
+
+    return events
+
+
+def parse_ical_events_with_icalendar(ical_data: str) -> List[ICalEvent]:
+    cal = Calendar.from_ical(ical_data)
+
+    events: List[ICalEvent] = []
+    for component in cal.walk("VEVENT"):
+        dtend = component.get("dtend")
+        events.append(
+            (
+                str(component.get("uid", "")),
+                str(component.get("summary", "")),
+                component.get("dtstart").dt,
+                dtend.dt if dtend else None,
+                str(component.get("description", "")),
+            )
+        )
+
+    return events
+
+
+# Set ICAL_PARSER=icalendar to fall back to the icalendar library
+def get_ical_parser_name() -> str:
+    return "icalendar" if os.environ.get("ICAL_PARSER") == "icalendar" else "scanner"
+
+
+def parse_ical_events(ical_data: str) -> List[ICalEvent]:
+    if get_ical_parser_name() == "icalendar":
+        return parse_ical_events_with_icalendar(ical_data)
+    return scan_ical_events(ical_data)
+
+
+def load_ical_events(ical_url: str) -> List[ICalEvent]:
+    ical_data, cache_meta = fetch_ical_data(ical_url)
+
+    # The parsed events are only reused for the same calendar version and parser
+    cache_key = (
+        cache_meta.get("etag"),
+        cache_meta.get("last_modified"),
+        get_ical_parser_name(),
+    )
+
+    if ical_data is None:
+        if os.path.exists(ICAL_PARSED_CACHE_PATH):
+            with open(ICAL_PARSED_CACHE_PATH, "rb") as f:
+                cached = pickle.load(f)
+            if isinstance(cached, tuple) and cached[0] == cache_key:
+                return cast(List[ICalEvent], cached[1])
+        with open(ICAL_CACHE_PATH, "rb") as f:
+            ical_data = f.read().decode("utf-8")
+
+    events = parse_ical_events(ical_data)
+    write_file_atomic(
+        ICAL_PARSED_CACHE_PATH, pickle.dumps((cache_key, events), protocol=5)
+    )
+    return events
+
+
+# Matches "Laplace"/"La Place" at the end of an event summary
+LAPLACE_SUFFIX_RE = re.compile(r"\b[lL]a ?[pP]lace$")
+
+
+# Matches "Laplace"/"La Place" anywhere in an event summary, in any case
+STAY_SUMMARY_RE = re.compile(r"(?i)la\s*place")
+
+
+# Stays usually have the format "PERSON at/à Laplace/La Place"
+def is_stay_summary(summary: str) -> bool:
+    return STAY_SUMMARY_RE.search(summary) is not None
+
+
+def guest_name_from_summary(summary: str) -> str:
+    # Remove Laplace/La Place from end
+    summary = LAPLACE_SUFFIX_RE.sub("", summary)
+    # Remove " at " or "à"
+    summary = summary.replace(" at ", "").replace("à", "")
+    return summary.strip()
+
+
+# Yield the events which are for a person staying at Laplace, in a single pass
+# over the calendar
+def iter_gcal_stays(days_ago: int | None = None) -> Iterator[GCalStay]:
     # Get the iCal URL from environment variables
     ical_url = os.environ.get("GOOGLE_CALENDAR_ICAL_URL")
 
@@ -63,175 +406,147 @@ def get_calendar_events(days_ago: int | None = None) -> List[GCalEvent]:
             "GOOGLE_CALENDAR_ICAL_URL is not set in the environment variables"
         )
 
-    # Fetch the iCal data
-    with urllib.request.urlopen(ical_url) as response:
-        if response.status != 200:
-            raise ValueError(f"HTTP error: {response.status}")
-        ical_data = response.read().decode("utf-8")  # Read and decode the response
-
-    # Parse the iCal data
-    cal = Calendar.from_ical(ical_data)  # Use ical_data instead of response.text
+    # Fetch and parse the iCal data
+    events = load_ical_events(ical_url)
 
     # Calculate the date range
     now = date.today()
     if days_ago is not None:
         time_ago = now - timedelta(days=days_ago)
 
-    events: List[GCalEvent] = []
-    for component in cal.walk():
-        if component.name == "VEVENT":
-            start = component.get("dtstart").dt
-            end = component.get("dtend").dt if component.get("dtend") else None
-            summary = str(component.get("summary"))
-
-            if isinstance(start, datetime):
-                logging.info(
-                    f"Skipping {summary} because it's not a stay (start is not a simple date)"
-                )
-                continue
-
-            if not end:
-                logging.info(
-                    f"Skipping {summary} because it's not a stay (end is not set)"
-                )
-                continue
-
-            if isinstance(end, datetime):
-                logging.info(
-                    f"Skipping {summary} because it's not a stay (end is not a simple date)"
-                )
-                continue
-
-            # Check if the event is within the specified date range
-            if (days_ago is None and end <= now) or (time_ago <= end <= now):
-                events.append(
-                    {
-                        "summary": summary,
-                        "start": start,
-                        "end": end,
-                        "description": str(component.get("description", "")),
-                        "id": component.get("uid"),
-                    }
-                )
-
-    return events
+    for uid, summary, start, end, description in events:
+        if isinstance(start, datetime):
+            logging.info(
+                "Skipping %s because it's not a stay (start is not a simple date)",
+                summary,
+            )
+            continue
 
+        if not end:
+            logging.info(
+                "Skipping %s because it's not a stay (end is not set)", summary
+            )
+            continue
 
-# Filter only events which are for a person staying at Laplace
-# They usually have the format "PERSON at/à Laplace/La Place"
-def filter_stay_events(events: List[GCalEvent]) -> List[GCalStay]:
+        if isinstance(end, datetime):
+            logging.info(
+                "Skipping %s because it's not a stay (end is not a simple date)",
+                summary,
+            )
+            continue
 
-    def guest_name_from_summary(summary: str) -> str:
-        # Remove Laplace/La Place from end
-        summary = re.sub(r"\b[lL]a ?[pP]lace$", "", summary)
-        # Remove " at " or "à"
-        summary = summary.replace(" at ", "").replace("à", "")
-        return summary.strip()
+        # Check if the event is within the specified date range
+        if end > now or (days_ago is not None and end < time_ago):
+            continue
 
-    def is_stay(event: GCalEvent) -> bool:
-        if not "laplace" in event["summary"].lower().replace(" ", ""):
+        if not is_stay_summary(summary):
             logging.info(
-                f"Skipping {event['summary']} because it's not a stay (no Laplace in name)"
+                "Skipping %s because it's not a stay (no Laplace in name)", summary
             )
-            return False
-        return True
-
-    return [
-        {
-            "summary": event["summary"],
-            "start": event["start"],
-            "end": event["end"],
-            "description": event["description"],
+            continue
+
+        yield {
+            "summary": summary,
+            "start": start,
+            "end": end,
+            "description": description,
             # Remove Laplace/La Place and previous word
-            "guest": guest_name_from_summary(event["summary"]),
-            "id": event["id"],
+            "guest": guest_name_from_summary(summary),
+            "id": uid,
         }
-        for event in events
-        if is_stay(event)
-    ]
 
 
-def get_existing_notion_stays() -> List[NotionStay]:
-    notion = Client(auth=os.environ["NOTION_TOKEN"])
-    database_id = os.environ["NOTION_GUEST_STAYS_DB_ID"]
+# Walk nested Notion properties, returning None if any step is missing
+def pluck(node: Any, *path: str | int) -> Any:
+    for key in path:
+        try:
+            node = node[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return node
+
+
+# Notion dates are either "YYYY-MM-DD" or a full ISO datetime with a time zone
+def parse_notion_date(value: str) -> date:
+    if len(value) == 10:
+        return date.fromisoformat(value)
+    return datetime.fromisoformat(value).date()
 
-    results = notion.databases.query(database_id=database_id)
-    results = cast(Dict[str, Any], results)
+
+# Notion stays, indexed by the ID of their Google Calendar event
+def get_existing_notion_stays() -> Dict[str, NotionStay]:
+    database_id = os.environ["NOTION_GUEST_STAYS_DB_ID"]
 
     # example of a row in notion_stay.json
-    typed_objects: List[NotionStay] = []
+    typed_objects: Dict[str, NotionStay] = {}
 
-    for item in results["results"]:
+    for item in query_notion_database(database_id):
         row_id = item["id"]
         properties = item["properties"]
 
         if "title" in properties["Name"]:
             name = " ".join(part["plain_text"] for part in properties["Name"]["title"])
         else:
-            logging.warning(f"Notion: No name found for {row_id}")
+            logging.warning("Notion: No name found for %s", row_id)
             name = "Empty stay"
 
-        date_property = properties.get("Date", {}).get("date", {})
-        start_date = date_property.get("start", None)
-        end_date = date_property.get("end", None)
+        start_date = pluck(properties, "Date", "date", "start")
+        end_date = pluck(properties, "Date", "date", "end")
         if not start_date or not end_date:
-            logging.warning(f"Notion: No date found for {name}")
+            logging.warning("Notion: No date found for %s", name)
             continue
 
-        if properties["Guest name"]["rollup"]["array"]:
-            guest_name = properties["Guest name"]["rollup"]["array"][0]["title"][0][
-                "plain_text"
-            ]
-        else:
-            logging.warning(f"Notion: No guest name found for {name}")
+        guest_name = pluck(
+            properties, "Guest name", "rollup", "array", 0, "title", 0, "plain_text"
+        )
+        if not guest_name:
+            logging.warning("Notion: No guest name found for %s", name)
             guest_name = "Unknown guest"
 
-        if properties.get("GCal ID", {}).get("rich_text", [{}])[0]["plain_text"]:
-            gcal_id = properties.get("GCal ID", {}).get("rich_text", [{}])[0][
-                "plain_text"
-            ]
-        else:
-            logging.warning(f"Notion: No GCal ID found for {name}")
+        gcal_id = pluck(properties, "GCal ID", "rich_text", 0, "plain_text")
+        if not gcal_id:
+            logging.warning("Notion: No GCal ID found for %s", name)
             continue
 
         typed_object: NotionStay = {
             "id": row_id,
             "Paid": properties["Paid"]["checkbox"],
-            "Start": datetime.fromisoformat(start_date).date(),
-            "End": datetime.fromisoformat(end_date).date(),
+            "Start": parse_notion_date(start_date),
+            "End": parse_notion_date(end_date),
             "Guest": guest_name,
             "Name": name,
             "GCalID": gcal_id,
         }
 
-        typed_objects.append(typed_object)
+        typed_objects[gcal_id] = typed_object
 
     return typed_objects
 
 
 def get_existing_notion_guests() -> Dict[str, NotionGuest]:
-    notion = Client(auth=os.environ["NOTION_TOKEN"])
     database_id = os.environ["NOTION_GUEST_DB_ID"]
 
-    results = notion.databases.query(database_id=database_id)
-    results = cast(Dict[str, Any], results)
-
     ambiguous_first_names: List[str] = []
 
     guests: Dict[str, NotionGuest] = {}
-    for item in results["results"]:
+    for item in query_notion_database(database_id):
         row_id = item["id"]
         properties = item["properties"]
 
         if "title" in properties["Name"]:
             name = " ".join(part["plain_text"] for part in properties["Name"]["title"])
         else:
-            logging.warning(f"Notion: No name found for {row_id}")
+            logging.warning("Notion: No name found for %s", row_id)
             continue
 
-        first_name = name.split(" ")[0].lower()
+        first_name = guest_key(name)
         if first_name in guests:
-            logging.warning(f"Notion: Ambiguous first name {first_name} for '{name}' and '{guests[first_name]['name']}'")
+            logging.warning(
+                "Notion: Ambiguous first name %s for '%s' and '%s'",
+                first_name,
+                name,
+                guests[first_name]["name"],
+            )
             ambiguous_first_names.append(first_name)
             del guests[first_name]
         elif first_name not in ambiguous_first_names:
@@ -247,20 +562,11 @@ def get_existing_notion_guests() -> Dict[str, NotionGuest]:
 # if guest name is in both and dates are the same, consider them the same
 # if a notion stay has the same date but not the same guest name, warn of ambiguity and consider different
 def find_missing_gcal_stays(
-    gcal_stays: List[GCalStay], notion_stays: List[NotionStay]
+    gcal_stays: List[GCalStay], notion_stays: Dict[str, NotionStay]
 ) -> List[GCalStay]:
 
-    existing_gcal_ids = set([stay["GCalID"] for stay in notion_stays])
-
-    # check if the gcal event is in the notion stayse
-    missing_stays: List[GCalStay] = []
-    for gcal_stay in gcal_stays:
-        if gcal_stay["id"] not in existing_gcal_ids:
-            missing_stays.append(gcal_stay)
-        else:
-            logging.info(f"GCal event {gcal_stay["summary"]} already in Notion")
-
-    return missing_stays
+    # check if the gcal event is in the notion stays
+    return [stay for stay in gcal_stays if stay["id"] not in notion_stays]
 
 
 # def find_missing_gcal_guests(
@@ -277,17 +583,16 @@ def find_missing_gcal_stays(
 def add_stay_to_notion(
     event: GCalStay, existing_guests: Dict[str, NotionGuest]
 ) -> None:
-    notion = Client(auth=os.environ["NOTION_TOKEN"])
+    notion = get_notion_client()
     database_id = os.environ["NOTION_GUEST_STAYS_DB_ID"]
 
-    if event["guest"].lower() in existing_guests:
-        notion_guest_id = existing_guests[event["guest"].lower()]["id"]
-        logging.info(f"Notion: Guest {event['guest']} found in Notion")
+    # Missing guests have already been added by add_missing_guests_to_notion
+    existing_guest = existing_guests.get(guest_key(event["guest"]))
+    if existing_guest:
+        notion_guest_id = existing_guest["id"]
     else:
-        logging.info(f"Notion: Guest {event['guest']} not found in Notion")
-        new_guest = add_guest_to_notion(event["guest"])
-        notion_guest_id = new_guest["id"]
-        existing_guests[event["guest"].lower()] = new_guest
+        logging.warning("Notion: Guest %s not found in Notion", event["guest"])
+        notion_guest_id = None
 
     properties = {
         "Name": {"title": [{"text": {"content": event["summary"]}}]},
@@ -307,23 +612,25 @@ def add_stay_to_notion(
             "relation": [{"id": notion_guest_id}],
         }
 
-    logging.info(f"Notion: Adding stay {event['summary']} to database")
-    notion.pages.create(
+    logging.info("Notion: Adding stay %s to database", event["summary"])
+    with_notion_retry(
+        notion.pages.create,
         parent={"database_id": database_id},
         properties=properties,
     )
 
 
 def add_guest_to_notion(guest: str) -> NotionGuest:
-    notion = Client(auth=os.environ["NOTION_TOKEN"])
+    notion = get_notion_client()
     database_id = os.environ["NOTION_GUEST_DB_ID"]
 
     properties = {
         "Name": {"title": [{"text": {"content": guest}}]},
     }
 
-    logging.info(f"Notion: Adding guest {guest} to database")
-    page = notion.pages.create(
+    logging.info("Notion: Adding guest %s to database", guest)
+    page = with_notion_retry(
+        notion.pages.create,
         parent={"database_id": database_id},
         properties=properties,
     )
@@ -335,12 +642,42 @@ def add_guest_to_notion(guest: str) -> NotionGuest:
     }
 
 
+# Create the guests of the stays which are not in Notion yet, once per guest,
+# and add them to existing_guests
+def add_missing_guests_to_notion(
+    stays: List[GCalStay], existing_guests: Dict[str, NotionGuest]
+) -> None:
+    new_guests: Dict[str, str] = {}
+    for stay in stays:
+        key = guest_key(stay["guest"])
+        if key not in existing_guests and key not in new_guests:
+            logging.info("Notion: Guest %s not found in Notion", stay["guest"])
+            new_guests[key] = stay["guest"]
+
+    with ThreadPoolExecutor(max_workers=NOTION_MAX_WORKERS) as executor:
+        created_guests = executor.map(add_guest_to_notion, new_guests.values())
+        existing_guests.update(zip(new_guests.keys(), created_guests))
+
+
 def main() -> None:
-    existing_guests = get_existing_notion_guests()
-    print(existing_guests)
-    existing_stays = get_existing_notion_stays()
-    events = get_calendar_events()
-    gcal_stays = filter_stay_events(events)
+    # Set up logging configuration, unless the host process already did
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO)  # You can adjust the level as needed
+
+    # Load environment variables from .env file
+    load_dotenv()
+
+    # The Notion queries and the calendar download are independent, so query
+    # Notion in the background while the calendar is fetched and parsed
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        existing_guests_future = executor.submit(get_existing_notion_guests)
+        existing_stays_future = executor.submit(get_existing_notion_stays)
+        gcal_stays = list(iter_gcal_stays())
+        existing_guests = existing_guests_future.result()
+        existing_stays = existing_stays_future.result()
+
+    if os.environ.get("NOTION_DEBUG_DUMP"):
+        print(existing_guests)
 
     print(f"Found {len(gcal_stays)} stays in Google Calendar")
     print(f"Found {len(existing_stays)} stays in Notion")
@@ -368,12 +705,17 @@ def main() -> None:
 
     # add_stay_to_notion(test_event_to_add)
 
-    count = 0
-    for stay in missing_stays:
-        count += 1
-        add_stay_to_notion(stay, existing_guests)
+    add_missing_guests_to_notion(missing_stays, existing_guests)
+
+    # Stays are independent, so insert them concurrently
+    with ThreadPoolExecutor(max_workers=NOTION_MAX_WORKERS) as executor:
+        list(
+            executor.map(
+                lambda stay: add_stay_to_notion(stay, existing_guests), missing_stays
+            )
+        )
 
-    logging.info(f"Added {count} stays to Notion")
+    logging.info("Added %d stays to Notion", len(missing_stays))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+import unittest
+from datetime import datetime
+from typing import Any, List, Tuple
+
+from sync import ICalEvent, parse_ical_events_with_icalendar, scan_ical_events
+
+ICAL_DATA = "\r\n".join(
+    [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "BEGIN:VTIMEZONE",
+        "TZID:Europe/Paris",
+        "END:VTIMEZONE",
+        "BEGIN:VEVENT",
+        "DTSTART;VALUE=DATE:20240310",
+        "DTEND;VALUE=DATE:20240312",
+        "UID:folded@google.com",
+        "SUMMARY:Alice at Laplace",
+        "DESCRIPTION:A description that is folded",
+        "  over two lines",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "DTSTART;VALUE=DATE:20240401",
+        "DTEND;VALUE=DATE:20240405",
+        "UID:escapes@google.com",
+        "SUMMARY:Bob\\, Carol \\; Dan à La Place",
+        "DESCRIPTION:First line\\nSecond line with a \\\\ backslash",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "DTSTART;VALUE=DATE:20240501",
+        "DTEND;VALUE=DATE:20240502",
+        "UID:alarm@google.com",
+        "SUMMARY:Eve at Laplace",
+        "BEGIN:VALARM",
+        "ACTION:DISPLAY",
+        "DESCRIPTION:Not the event description",
+        "END:VALARM",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "DTSTART;TZID=Europe/Paris:20240601T100000",
+        "DTEND;TZID=Europe/Paris:20240601T110000",
+        "UID:timed@google.com",
+        "SUMMARY:Meeting",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "DTSTART:20240602T100000Z",
+        "DTEND:20240602T110000Z",
+        "UID:utc@google.com",
+        "SUMMARY:Call",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        'DTSTART;TZID="(UTC+01:00) Amsterdam, Berlin":20240603T100000',
+        'DTEND;TZID="(UTC+01:00) Amsterdam, Berlin":20240603T110000',
+        "UID:quoted-tzid@outlook.com",
+        "SUMMARY:Outlook meeting",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "DTSTART;VALUE=DATE:20240701",
+        "UID:no-end@google.com",
+        "SUMMARY:Frank at laplace",
+        "END:VEVENT",
+        "END:VCALENDAR",
+        "",
+    ]
+)
+
+
+# The scanner doesn't resolve time zones, so only compare wall-clock times
+def without_timezones(events: List[ICalEvent]) -> List[Tuple[Any, ...]]:
+    return [
+        tuple(
+            value.replace(tzinfo=None) if isinstance(value, datetime) else value
+            for value in event
+        )
+        for event in events
+    ]
+
+
+class ScanIcalEventsTest(unittest.TestCase):
+    def test_matches_icalendar(self) -> None:
+        self.assertEqual(
+            without_timezones(scan_ical_events(ICAL_DATA)),
+            without_timezones(parse_ical_events_with_icalendar(ICAL_DATA)),
+        )
+
+    def test_keeps_utc_timezone(self) -> None:
+        events = {event[0]: event for event in scan_ical_events(ICAL_DATA)}
+        self.assertEqual(
+            events["utc@google.com"][2],
+            parse_ical_events_with_icalendar(ICAL_DATA)[4][2],
+        )
+
+    def test_skips_event_with_invalid_date(self) -> None:
+        ical_data = ICAL_DATA.replace("20240701", "2024-07-01")
+        with self.assertLogs(level="WARNING"):
+            events = scan_ical_events(ical_data)
+        self.assertNotIn("no-end@google.com", [event[0] for event in events])
+
+
+if __name__ == "__main__":
+    unittest.main()